@@ -22,12 +22,48 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
 import sys
 import math
+import ctypes
+import functools
 import threading
+import concurrent.futures
+
+import numpy as np
 
 from tellusimd import *
 
+#
+# set array
+#
+def set_array(data, array, callback):
+	
+	# object storage exported by the binding
+	try:
+		view = np.frombuffer(memoryview(data).cast('B'), array.dtype)
+	except (TypeError, BufferError, ValueError):
+		view = None
+	
+	# copy into the storage if its layout matches
+	if view is not None and view.flags.writeable and view.size == array.size:
+		view[:] = array.ravel()
+	
+	# set elements one by one otherwise
+	else:
+		for index, value in enumerate(array.tolist()):
+			callback(index, value)
+
+#
+# common parameters
+#
+class CommonParameters(ctypes.Structure):
+	_fields_ = [
+		('transform', ctypes.c_float * 16),
+		('color', ctypes.c_float * 4),
+		('time', ctypes.c_float),
+	]
+
 #
 # create mesh
 #
@@ -43,22 +79,45 @@ def create_mesh(steps, radius, texcoord):
 	tangents = MeshAttribute(MeshAttribute.TypeTangent, FormatRGBAf32, num_vertices)
 	texcoords = MeshAttribute(MeshAttribute.TypeTexCoord, FormatRGf32, num_vertices)
 	
-	vertex = 0
-	isteps = 1.0 / Vector2f(steps)
+	shape = (steps.y + 1, steps.x + 1)
+	ty = (np.arange(steps.y + 1) / steps.y)[:, None]
+	tx = (np.arange(steps.x + 1) / steps.x)[None, :]
+	angle_y = ty * Pi2 - Pi05
+	angle_x = tx * Pi2
+	z = -np.cos(angle_y)
+	r = np.sin(angle_y)
+	x = -np.sin(angle_x)
+	y = np.cos(angle_x)
+	ring = r * radius.y + radius.x
 	aspect = radius.x / radius.y
-	for j in range(steps.y + 1):
-		ty = j * isteps.y
-		z = -math.cos(ty * Pi2 - Pi05)
-		r = math.sin(ty * Pi2 - Pi05)
-		for i in range(steps.x + 1):
-			tx = i * isteps.x
-			x = -math.sin(tx * Pi2)
-			y = math.cos(tx * Pi2)
-			positions.set(vertex, Vector3f(x * (r * radius.y + radius.x), y * (r * radius.y + radius.x), z * radius.y))
-			normals.set(vertex, Vector3f(x * r, y * r, z))
-			tangents.set(vertex, Vector4f(-y, x, 0.0, 1.0))
-			texcoords.set(vertex, Vector2f(tx * aspect, ty) * texcoord)
-			vertex += 1
+	
+	# fill attributes
+	position = np.empty(shape + (3,), np.float32)
+	position[..., 0] = x * ring
+	position[..., 1] = y * ring
+	position[..., 2] = z * radius.y
+	
+	set_array(positions, position.reshape(-1, 3), lambda index, value: positions.set(index, Vector3f(*value)))
+	
+	normal = np.empty(shape + (3,), np.float32)
+	normal[..., 0] = x * r
+	normal[..., 1] = y * r
+	normal[..., 2] = z
+	
+	set_array(normals, normal.reshape(-1, 3), lambda index, value: normals.set(index, Vector3f(*value)))
+	
+	tangent = np.empty(shape + (4,), np.float32)
+	tangent[..., 0] = -y
+	tangent[..., 1] = x
+	tangent[..., 2] = 0.0
+	tangent[..., 3] = 1.0
+	
+	set_array(tangents, tangent.reshape(-1, 4), lambda index, value: tangents.set(index, Vector4f(*value)))
+	
+	coord = np.empty(shape + (2,), np.float32)
+	coord[..., 0] = tx * aspect * texcoord
+	coord[..., 1] = ty * texcoord
+	set_array(texcoords, coord.reshape(-1, 2), lambda index, value: texcoords.set(index, Vector2f(*value)))
 	
 	basis = MeshAttribute(MeshAttribute.TypeBasis, FormatRGBAu32, num_vertices)
 	basis.packAttributes(normals, tangents, FormatRGBAf16)
@@ -68,12 +127,10 @@ def create_mesh(steps, radius, texcoord):
 	indices_format = FormatRu16 if num_vertices < Maxu16 else FormatRu32
 	indices = MeshIndices(MeshIndices.TypeQuadrilateral, indices_format, num_indices)
 	
-	index = 0
-	for j in range(steps.y):
-		for i in range(steps.x):
-			vertex = (steps.x + 1) * j + i
-			indices.set(index, vertex, vertex + 1, vertex + steps.x + 2, vertex + steps.x + 1)
-			index += 4
+	vertex = ((steps.x + 1) * np.arange(steps.y)[:, None] + np.arange(steps.x)[None, :]).reshape(-1, 1)
+	indices_dtype = np.uint16 if indices_format == FormatRu16 else np.uint32
+	quads = (vertex + (0, 1, steps.x + 2, steps.x + 1)).astype(indices_dtype)
+	set_array(indices, quads, lambda index, value: indices.set(index * 4, *value))
 	
 	# create geometry
 	geometry = MeshGeometry(mesh)
@@ -91,6 +148,19 @@ def create_mesh(steps, radius, texcoord):
 	
 	return mesh
 
+#
+# image palette
+#
+@functools.lru_cache(1)
+def get_palette():
+	
+	# color palette
+	v = np.arange(256)[:, None] / 63.0
+	palette = (np.cos(np.array([ Pi * 1.0, Pi * 0.5, Pi * 0.0 ]) + v) * 127.5 + 127.5).astype(np.uint8)
+	palette.setflags(write=False)
+	
+	return palette
+
 #
 # create image
 #
@@ -102,16 +172,18 @@ def create_image(size, frame):
 	
 	# create sampler
 	sampler = ImageSampler(image)
+	color = ImageColor(255)
+	def set_pixel(index, value):
+		color.r, color.g, color.b, color.a = value
+		sampler.set2D(index % size, index // size, color)
 	
 	# fill image
-	color = ImageColor(255)
-	for y in range(size):
-		for x in range(size):
-			v = (((x - (frame ^ y)) ^ (y + (frame ^ x))) & 255) / 63.0
-			color.r = int(math.cos(Pi * 1.0 + v) * 127.5 + 127.5)
-			color.g = int(math.cos(Pi * 0.5 + v) * 127.5 + 127.5)
-			color.b = int(math.cos(Pi * 0.0 + v) * 127.5 + 127.5)
-			sampler.set2D(x, y, color)
+	x = np.arange(size)[None, :]
+	y = np.arange(size)[:, None]
+	pixels = np.empty((size, size, 4), np.uint8)
+	pixels[..., 0:3] = get_palette()[((x - (frame ^ y)) ^ (y + (frame ^ x))) & 255]
+	pixels[..., 3] = 255
+	set_array(image, pixels.reshape(-1, 4), set_pixel)
 	
 	return image
 
@@ -131,12 +203,21 @@ def main(argv):
 	window.setSize(app.getWidth(), app.getHeight())
 	window.setCloseClickedCallback(lambda: window.stop())
 	
+	# screenshot executor
+	screenshot_executor = concurrent.futures.ThreadPoolExecutor(1)
+	
+	def save_callback(image):
+		if image.save('screenshot.png'): Log.print(Log.Message, 'Screenshot\n')
+		else: Log.print(Log.Error, 'Screenshot failed\n')
+	
+	def saved_callback(future):
+		if future.exception(): Log.printf(Log.Error, 'Screenshot error: %s\n', str(future.exception()))
+	
 	def clicked_callback(key, code):
 		if key == Window.KeyEsc: window.stop()
 		if key == Window.KeyF12:
 			image = Image()
-			if window.grab(image) and image.save('screenshot.png'):
-				Log.print(Log.Message, 'Screenshot\n')
+			if window.grab(image): screenshot_executor.submit(save_callback, image).add_done_callback(saved_callback)
 	
 	window.setKeyboardPressedCallback(clicked_callback)
 	
@@ -229,6 +310,8 @@ def main(argv):
 	
 	# common parameters
 	color = Color.white
+	parameters = bytearray(ctypes.sizeof(CommonParameters))
+	common_parameters = CommonParameters.from_buffer(parameters)
 	
 	# create sliders
 	slider_r = ControlSlider(dialog, 'R', 2, color.r, 0.0, 1.0)
@@ -259,14 +342,16 @@ def main(argv):
 	# manager cache
 	SceneManager.setShaderCache('shader.cache')
 	SceneManager.setTextureCache('texture.cache')
+	manager_cached = os.path.exists('shader.cache') and os.path.exists('texture.cache')
 	
 	# create scene manager
 	scene_manager = SceneManager()
-	if True:
+	if not manager_cached:
 		if not scene_manager.create(device, SceneManager.DefaultFlags, lambda progress: Log.printf(Log.Message, 'SceneManager %u%%   \r', progress)): return 1
 		Log.print('\n')
 	else:
 		if not scene_manager.create(device): return 1
+		Log.print(Log.Message, 'SceneManager cached\n')
 	
 	# process thread
 	def process_callback():
@@ -284,14 +369,16 @@ def main(argv):
 	# create render manager
 	render_manager = RenderManager(scene_manager)
 	render_manager.setDrawParameters(device, window.getColorFormat(), window.getDepthFormat(), window.getMultisample())
-	if True:
+	if not manager_cached:
 		if not render_manager.create(device, RenderManager.DefaultFlags, lambda progress: Log.printf(Log.Message, 'RenderManager %u%%   \r', progress)): return 1
 		Log.print('\n')
 	else:
 		if not render_manager.create(device): return 1
+		Log.print(Log.Message, 'RenderManager cached\n')
 	
 	# create render frame
 	render_frame = RenderFrame(render_manager)
+	render_frames = [ render_frame ]
 	
 	# render resources
 	render_renderer = render_manager.getRenderer()
@@ -339,12 +426,17 @@ def main(argv):
 	texture_frame = 0
 	texture_ifps = 1.0 / 3.0
 	texture_time = 0.0
+	texture_future = None
+	
+	# texture executor
+	texture_executor = concurrent.futures.ThreadPoolExecutor(1)
 	
 	# main loop
 	def main_loop():
 		nonlocal texture_frame
 		nonlocal texture_ifps
 		nonlocal texture_time
+		nonlocal texture_future
 		
 		# update window
 		Window.update()
@@ -364,12 +456,14 @@ def main(argv):
 				Log.printf(Log.Message, 'Frame Resized %ux%u\n', window.getWidth(), window.getHeight())
 			
 			# update diffuse texture
-			if Time.seconds() - texture_time > texture_ifps:
-				texture_time += texture_ifps
-				image = create_image(128, texture_frame)
-				material.setTexture(MaterialMetallic.TextureDiffuse, 'procedural', image)
+			if texture_future and texture_future.done():
+				material.setTexture(MaterialMetallic.TextureDiffuse, 'procedural', texture_future.result())
 				material.updateScene()
-				texture_frame += 1
+				texture_future = None
+			if not texture_future and Time.seconds() - texture_time > texture_ifps:
+				texture_time += texture_ifps
+				texture_future = texture_executor.submit(create_image, 128, texture_frame)
+				texture_frame = (texture_frame + 1) & 255
 			
 			# update graph
 			time = Time.seconds()
@@ -396,7 +490,6 @@ def main(argv):
 			scene.dispatch(device, compute, node_camera)
 			
 			# dispatch render (multi-frame test)
-			render_frames = [ render_frame ]
 			render_spatial.dispatchFrames(compute, node_camera, render_frames)
 			render_spatial.dispatchObjects(compute, render_frames)
 			render_renderer.dispatchFrames(compute, render_frames)
@@ -463,10 +556,9 @@ def main(argv):
 			time = Time.seconds()
 			
 			# common parameters
-			parameters = bytearray()
-			parameters += Matrix4x4f.rotateZ(time * 16.0)
-			parameters += color
-			parameters += Scalarf(time)
+			parameters[CommonParameters.transform.offset:CommonParameters.color.offset] = Matrix4x4f.rotateZ(time * 16.0)
+			parameters[CommonParameters.color.offset:CommonParameters.time.offset] = color
+			common_parameters.time = time
 			
 			# draw background
 			command.setPipeline(pipeline)
@@ -492,6 +584,10 @@ def main(argv):
 	
 	window.run(main_loop)
 	
+	# stop executors
+	texture_executor.shutdown()
+	screenshot_executor.shutdown()
+	
 	# stop process thread
 	scene_manager.terminate()
 	